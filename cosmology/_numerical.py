@@ -0,0 +1,367 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+'''internal module for numerical methods'''
+
+from functools import partial
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# nodes and weights of the Bogacki-Shampine method
+RK23_A = np.array([0., 1/2, 3/4, 1.])
+RK23_C = np.array([2/9, 1/3, 4/9, 0.])
+RK23_CS = np.array([7/24, 1/4, 1/3, 1/8])
+
+
+def _rk23_python(f, x0, x1, y0, h, atol, rtol, a, c, cs):
+    '''pure-Python step loop for :func:`rk23`'''
+
+    cap = max(64, int((x1 - x0)/h) + 8)
+    tb = np.empty((cap, 3))
+    n = 0
+
+    xn, yn = x0, y0
+    k = np.empty(4)
+    k[0] = f(np.full(1, xn))[0]
+    while xn < x1:
+        if xn + h > x1:
+            h = x1 - xn
+        # first same as last: k[0] is carried over from the previous step
+        k[1:] = f(xn + a[1:]*h)
+        D0 = h*(c @ k)
+        D1 = h*(cs @ k)
+        err = abs(D1 - D0)
+        tol = atol + rtol*abs(yn + D0)
+        if err <= tol:
+            if n == cap:
+                cap = 2*cap
+                tb = np.resize(tb, (cap, 3))
+            tb[n, 0] = xn
+            tb[n, 1] = yn
+            tb[n, 2] = k[0]
+            n = n + 1
+            xn = xn + h
+            yn = yn + D0
+            k[0] = k[3]
+        if err > 0:
+            h = h*min(5., max(0.2, 0.9*(tol/err)**(1/3)))
+        else:
+            h = 5.*h
+
+    if n == cap:
+        cap = cap + 1
+        tb = np.resize(tb, (cap, 3))
+    tb[n, 0] = xn
+    tb[n, 1] = yn
+    tb[n, 2] = k[0]
+    n = n + 1
+
+    return tb[:n, 0], tb[:n, 1], tb[:n, 2]
+
+
+if numba is not None:
+
+    # fastmath lets the compiler contract the stage sums into FMAs and
+    # vectorize them, as a hand-written C kernel would with -O3
+    @numba.njit(cache=True, fastmath=True)
+    def _rk23_core(f, x0, x1, y0, h, atol, rtol, a, c, cs):
+        '''compiled step loop for :func:`rk23`'''
+
+        cap = max(64, int((x1 - x0)/h) + 8)
+        tb = np.empty((cap, 3))
+        n = 0
+
+        xn, yn = x0, y0
+        k = np.empty(4)
+        k[0] = f(np.full(1, xn))[0]
+        while xn < x1:
+            if xn + h > x1:
+                h = x1 - xn
+            # first same as last: k[0] is carried over from the previous step
+            k[1:] = f(xn + a[1:]*h)
+            D0 = h*(c[0]*k[0] + c[1]*k[1] + c[2]*k[2] + c[3]*k[3])
+            D1 = h*(cs[0]*k[0] + cs[1]*k[1] + cs[2]*k[2] + cs[3]*k[3])
+            err = abs(D1 - D0)
+            tol = atol + rtol*abs(yn + D0)
+            if err <= tol:
+                if n == cap:
+                    cap = 2*cap
+                    tb_ = tb
+                    tb = np.empty((cap, 3))
+                    tb[:n] = tb_[:n]
+                tb[n, 0] = xn
+                tb[n, 1] = yn
+                tb[n, 2] = k[0]
+                n = n + 1
+                xn = xn + h
+                yn = yn + D0
+                k[0] = k[3]
+            if err > 0:
+                h = h*min(5., max(0.2, 0.9*(tol/err)**(1/3)))
+            else:
+                h = 5.*h
+
+        if n == cap:
+            cap = cap + 1
+            tb_ = tb
+            tb = np.empty((cap, 3))
+            tb[:n] = tb_[:n]
+        tb[n, 0] = xn
+        tb[n, 1] = yn
+        tb[n, 2] = k[0]
+        n = n + 1
+
+        return tb[:n, 0], tb[:n, 1], tb[:n, 2]
+
+
+def _initial_step(f, x0, y0, atol, rtol):
+    '''initial step size estimate following Hairer & Wanner
+
+    Combines the magnitudes of the solution, the derivative, and a finite
+    difference estimate of the second derivative into a step size for which
+    the local error of an order-3 method is near the tolerance.
+
+    '''
+
+    f0 = f(np.full(1, x0))[0]
+    sc = atol + rtol*abs(y0)
+    d0 = abs(y0)/sc
+    d1 = abs(f0)/sc
+    if d0 < 1e-5 or d1 < 1e-5:
+        h0 = 1e-6
+    else:
+        h0 = 0.01*d0/d1
+    f1 = f(np.full(1, x0 + h0))[0]
+    d2 = abs(f1 - f0)/(sc*h0)
+    if max(d1, d2) <= 1e-15:
+        h1 = max(1e-6, 1e-3*h0)
+    else:
+        h1 = (0.01/max(d1, d2))**(1/4)
+    return min(100*h0, h1)
+
+
+def rk23(f, x0, x1, y0=0., h=None, atol=1e-8, rtol=1e-8):
+    '''adaptive solution of :math:`y' = f(x)` with the Bogacki-Shampine method
+
+    Integrates the function ``f`` from ``x0`` to ``x1`` with initial value
+    ``y0`` using an embedded Runge-Kutta method of order 3(2) with adaptive
+    step size.  The function ``f`` must be vectorized, as it is evaluated on
+    the stencil of nodes for each step.
+
+    If no initial step size ``h`` is given, it is estimated from the local
+    behaviour of ``f``, which avoids a cascade of rejected steps at the
+    start of the integration.
+
+    If numba is installed and ``f`` is a numba-compiled function, a compiled
+    step loop is used, and the call to ``f`` is inlined by the compiler.
+
+    Returns arrays ``x``, ``y``, ``yp`` of positions, values, and derivatives
+    for the accepted steps.
+
+    '''
+
+    if h is None:
+        h = _initial_step(f, float(x0), float(y0), atol, rtol)
+
+    if numba is not None and isinstance(f, numba.core.dispatcher.Dispatcher):
+        core = _rk23_core
+    else:
+        core = _rk23_python
+
+    return core(f, float(x0), float(x1), float(y0), float(h), atol, rtol,
+                RK23_A, RK23_C, RK23_CS)
+
+
+def _hermite(t, f0, f1, fp0, fp1):
+    '''evaluate the cubic Hermite polynomial on the unit interval
+
+    With numexpr, the full expression is fused into a single pass over the
+    inputs instead of materializing an intermediate array per operation.
+
+    '''
+
+    if numexpr is not None:
+        return numexpr.evaluate(
+            '(((2*(f0 - f1) + fp0 + fp1)*t'
+            ' + (3*(f1 - f0) - 2*fp0 - fp1))*t + fp0)*t + f0')
+    a = 2*(f0 - f1) + fp0 + fp1
+    b = 3*(f1 - f0) - 2*fp0 - fp1
+    return ((a*t + b)*t + fp0)*t + f0
+
+
+def cubic(xi, x, y, yp):
+    '''evaluate the cubic Hermite interpolant through points and derivatives'''
+
+    i1 = np.clip(np.digitize(xi, x), 1, len(x)-1)
+    i0 = i1 - 1
+    x0 = x[i0]
+    dx = x[i1] - x0
+    t = (xi - x0)/dx
+    return _hermite(t, y[i0], y[i1], yp[i0]*dx, yp[i1]*dx)
+
+
+def _cubic_table(xi, table):
+    '''evaluate the cubic Hermite interpolant from a packed table
+
+    Same as :func:`cubic` for a table with rows ``(x, y, yp)``, so that the
+    interpolation record of each interval is gathered as two contiguous
+    rows instead of six separate strided loads.
+
+    '''
+
+    i1 = np.clip(np.digitize(xi, table[:, 0]), 1, len(table)-1)
+    r0, r1 = table[i1-1], table[i1]
+    x0 = r0[..., 0]
+    dx = r1[..., 0] - x0
+    t = (xi - x0)/dx
+    return _hermite(t, r0[..., 1], r1[..., 1], r0[..., 2]*dx, r1[..., 2]*dx)
+
+
+def _cubic_uniform(xi, x0, dx, table):
+    '''evaluate the cubic Hermite interpolant on a uniform grid
+
+    Same as :func:`_cubic_table` for points ``x0 + i*dx``, but with O(1)
+    index computation instead of a bisection per point.
+
+    '''
+
+    i0 = np.clip(np.floor((xi - x0)/dx).astype(np.intp), 0, len(table)-2)
+    r0, r1 = table[i0], table[i0+1]
+    t = (xi - x0)/dx - i0
+    return _hermite(t, r0[..., 1], r1[..., 1], r0[..., 2]*dx, r1[..., 2]*dx)
+
+
+if numba is not None:
+
+    @numba.njit(cache=True, fastmath=True)
+    def _cubic_table_jit(xi, table):
+        '''compiled table lookup and Hermite evaluation'''
+        m = len(table)
+        out = np.empty(len(xi))
+        for i in range(len(xi)):
+            j = np.searchsorted(table[:, 0], xi[i], side='right')
+            if j < 1:
+                j = 1
+            elif j > m-1:
+                j = m-1
+            j = j - 1
+            x0 = table[j, 0]
+            dx = table[j+1, 0] - x0
+            t = (xi[i] - x0)/dx
+            f0, f1 = table[j, 1], table[j+1, 1]
+            fp0, fp1 = table[j, 2]*dx, table[j+1, 2]*dx
+            a = 2*(f0 - f1) + fp0 + fp1
+            b = 3*(f1 - f0) - 2*fp0 - fp1
+            out[i] = ((a*t + b)*t + fp0)*t + f0
+        return out
+
+    @numba.njit(cache=True, fastmath=True)
+    def _cubic_uniform_jit(xi, x0, dx, table):
+        '''compiled uniform-grid lookup and Hermite evaluation'''
+        m = len(table)
+        out = np.empty(len(xi))
+        for i in range(len(xi)):
+            u = (xi[i] - x0)/dx
+            j = int(u)
+            if j < 0:
+                j = 0
+            elif j > m-2:
+                j = m-2
+            t = u - j
+            f0, f1 = table[j, 1], table[j+1, 1]
+            fp0, fp1 = table[j, 2]*dx, table[j+1, 2]*dx
+            a = 2*(f0 - f1) + fp0 + fp1
+            b = 3*(f1 - f0) - 2*fp0 - fp1
+            out[i] = ((a*t + b)*t + fp0)*t + f0
+        return out
+
+    def _cubic_compiled(xi, table):
+        '''evaluate :func:`_cubic_table` through the compiled kernel'''
+        xi = np.ascontiguousarray(xi, dtype=np.float64)
+        return _cubic_table_jit(xi.ravel(), table).reshape(xi.shape)
+
+    def _cubic_uniform_compiled(xi, x0, dx, table):
+        '''evaluate :func:`_cubic_uniform` through the compiled kernel'''
+        xi = np.ascontiguousarray(xi, dtype=np.float64)
+        return _cubic_uniform_jit(xi.ravel(), x0, dx, table).reshape(xi.shape)
+
+
+def _interpolant(x, y, yp):
+    '''interpolating function through points and derivatives
+
+    Packs the points and derivatives into a table with rows ``(x, y, yp)``,
+    reusing the storage of :func:`rk23` outputs, which are columns of such
+    a table already.  Uses the uniform-grid fast path of
+    :func:`_cubic_uniform` when the grid spacing allows it, and generic
+    :func:`_cubic_table` interpolation otherwise.
+
+    With numba, the returned function binds the table to a compiled
+    evaluation kernel instead.  The kernels are module level, so they are
+    compiled once per table signature rather than once per interpolant;
+    a zero-length warm-up call triggers the compilation at construction
+    time rather than on first use.
+
+    '''
+
+    b = x.base
+    if b is not None and b is y.base and b is yp.base \
+            and b.ndim == 2 and b.shape[1] == 3 \
+            and x.strides == (b.strides[0],):
+        table = b[:len(x)]
+    else:
+        table = np.stack(np.broadcast_arrays(x, y, yp), axis=-1)
+    dx = x[1] - x[0]
+    uniform = np.allclose(np.diff(x), dx)
+    if numba is not None and table.dtype == np.float64:
+        if uniform:
+            fn = partial(_cubic_uniform_compiled, x0=float(x[0]),
+                         dx=float(dx), table=table)
+        else:
+            fn = partial(_cubic_compiled, table=table)
+        fn(np.empty(0))
+        return fn
+    if uniform:
+        return partial(_cubic_uniform, x0=x[0], dx=dx, table=table)
+    return partial(_cubic_table, table=table)
+
+
+def antideriv(f, x0, x1, y0=0., inverse=False, **kwargs):
+    '''interpolated antiderivative :math:`y_0 + \\int_{x_0}^{x} f(t) \\, dt`
+
+    Computes the antiderivative of ``f`` over the interval ``x0`` to ``x1``
+    using :func:`rk23` and returns a function that interpolates the result.
+    If ``inverse`` is true, the inverse function is returned instead, which
+    requires the antiderivative to be strictly monotonic.
+
+    Keyword arguments are passed on to :func:`rk23`.
+
+    '''
+
+    x, y, yp = rk23(f, x0, x1, y0, **kwargs)
+
+    if not inverse:
+        return _interpolant(x, y, yp)
+
+    # derivative of the inverse function, computed once and shared by both
+    # branches; clamped away from zero so flat stretches of the
+    # antiderivative do not divide by zero
+    tiny = np.finfo(yp.dtype).tiny
+    inv_yp = 1/np.copysign(np.maximum(np.fabs(yp), tiny), yp)
+
+    # sign of the extreme differences decides monotonicity; a vectorized
+    # reduction each, with no intermediate boolean arrays
+    dy = np.diff(y)
+    if dy.min() > 0:
+        return _interpolant(y, x, inv_yp)
+    elif dy.max() < 0:
+        return _interpolant(y[::-1], x[::-1], inv_yp[::-1])
+    else:
+        raise ValueError('antiderivative is not invertible')
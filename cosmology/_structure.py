@@ -2,14 +2,109 @@
 # license: MIT
 '''module for large scale structure'''
 
+import cmath
+import math
+from functools import lru_cache
+
 import numpy as np
-from scipy.special import loggamma
-from fftl import fftl
+from scipy.fft import rfft, irfft
+from scipy.special import gamma, loggamma
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
 
 PI = np.pi
 SRPI = PI**0.5
 
 
+def _scale(a, f):
+    '''divide ``a`` by ``f`` in place
+
+    With numexpr, the division runs as a single multithreaded pass, which
+    parallelizes over the rows of batched input.
+
+    '''
+
+    if numexpr is not None:
+        numexpr.evaluate('a / f', out=a)
+    else:
+        a /= f
+    return a
+
+
+@lru_cache(maxsize=64)
+def _k_bias(n, lnkc, dlnk, q, single=False):
+    '''cached bias factors ``k**(2-q)`` for a logarithmic wavenumber grid
+
+    The grid is characterised by its size, centre, and spacing, which keys
+    the cache, so parameter scans over a fixed grid skip the pow loop.
+    If ``single`` is true, the factors are returned in single precision.
+
+    '''
+
+    j, jc = np.arange(n), (n-1)/2
+    b = np.exp((2 - q)*(lnkc + (j - jc)*dlnk))
+    return b.astype(np.float32) if single else b
+
+
+@lru_cache(maxsize=64)
+def _fftlog_kernel(n, dlnk, lnkr, q, window, krgood, single=False):
+    '''cached FFTLog kernel for :func:`sigma2_r`
+
+    For a fixed wavenumber grid and transform parameters, the kernel is
+    identical across calls, so it is constructed once and cached.  Returns
+    the frequencies ``y``, the kernel ``um``, and the possibly adjusted
+    shift ``lnkr``.  If ``single`` is true, the frequencies and kernel are
+    returned in single precision.
+
+    '''
+
+    # window function
+    if window == 'tophat':
+        if not -1 < q < 3:
+            raise ValueError('bias error: tophat window requires -1 < q < 3')
+
+        def u(x):
+            dlg = loggamma((1 + x)/2) - loggamma((4 - x)/2)
+            return 9*SRPI*np.exp(dlg)/((4 - x)**2 - 1)
+
+    elif window == 'gaussian':
+        if not q > -1:
+            raise ValueError('bias error: gaussian window requires q > -1')
+
+        def u(x):
+            # one vectorized call; going through loggamma costs an extra
+            # exp pass, and |gamma| decays with imaginary argument, so
+            # there is no overflow to guard against here
+            return gamma((x + 1)/2)/2
+
+    else:
+        raise ValueError(f'unknown window function: {window}')
+
+    # frequencies of the periodic expansion
+    y = np.linspace(0, 2*PI*(n//2)/(n*dlnk), n//2+1)
+
+    # optionally fix up the shift of the output grid for low ringing;
+    # this is scalar arithmetic, so go through math/cmath rather than
+    # dispatching single values through the ufunc machinery
+    if krgood:
+        un = cmath.exp(-1j*(PI/dlnk)*lnkr)*complex(u(q + 1j*PI/dlnk))
+        a = math.atan2(un.imag, un.real)/PI
+        lnkr = lnkr + dlnk*(a - round(a))
+
+    # transform kernel for the given window
+    um = np.exp(-1j*y*lnkr)*u(q + 1j*y)
+    if not n % 2:
+        um.imag[-1] = 0
+
+    if single:
+        y, um = y.astype(np.float32), um.astype(np.complex64)
+
+    return y, um, lnkr
+
+
 def sigma2_r(k, pk, q=0.0, kr=1.0, window='tophat', krgood=True, deriv=False):
     r'''mass variance from matter power spectrum
 
@@ -33,7 +128,8 @@ def sigma2_r(k, pk, q=0.0, kr=1.0, window='tophat', krgood=True, deriv=False):
         logarithmic spacing.
     pk : array_like (..., N)
         Power spectrum for given wavenumbers ``k``.  Can be multidimensional.
-        Last axis must agree with the wavenumber axis.
+        Last axis must agree with the wavenumber axis.  If given in single
+        precision, the transform is computed in single precision.
     q : float, optional
         Bias parameter for integral transform.
     kr : float, optional
@@ -144,33 +240,92 @@ def sigma2_r(k, pk, q=0.0, kr=1.0, window='tophat', krgood=True, deriv=False):
 
     '''
 
-    # window function
-    if window == 'tophat':
-        if not -1 < q < 3:
-            raise ValueError('bias error: tophat window requires -1 < q < 3')
+    k = np.asanyarray(k)
+    pk = np.asanyarray(pk)
 
-        def u(x):
-            dlg = loggamma((1 + x)/2) - loggamma((4 - x)/2)
-            return 9*SRPI*np.exp(dlg)/((4 - x)**2 - 1)
+    if np.ndim(k) != 1:
+        raise TypeError('k must be 1d array')
+    if pk.shape[-1] != k.shape[-1]:
+        raise ValueError('last axis of pk must agree with size of k')
 
-    elif window == 'gaussian':
-        if not q > -1:
-            raise ValueError('bias error: gaussian window requires q > -1')
+    # check the wavenumber grid: logarithmic spacing means equal steps in
+    # log(k), which avoids reconstructing the grid with a full exp pass
+    n = k.shape[-1]
+    lnk = np.log(k)
+    lnkc = (lnk[0] + lnk[-1])/2
+    dlnk = (lnk[-1] - lnk[0])/(n-1)
+    if not np.allclose(np.diff(lnk), dlnk, rtol=1e-10):
+        raise ValueError('k must have logarithmic spacing')
 
-        def u(x):
-            return np.exp(loggamma((x + 1)/2))/2
+    # single precision input gets a single precision transform
+    single = pk.dtype == np.float32
 
-    else:
-        raise ValueError(f'unknown window function: {window}')
+    # transform kernel for the given window, cached across calls
+    y, um, lnkr = _fftlog_kernel(n, dlnk, math.log(kr), float(q),
+                                 window, bool(krgood), single)
 
-    # compute the transform for the given window
+    # FFTLog: biased transform of the input, multiplied by the kernel
     # input function of the transform is pk*k**2 to give a more natural bias
-    r, *vals = fftl(u, k, pk*k**2, q=q, kr=kr, krgood=krgood, deriv=deriv)
+    if q != 2:
+        ak = pk*_k_bias(n, float(lnkc), float(dlnk), float(q), single)
+    else:
+        ak = pk
+    cm = rfft(ak, axis=-1, overwrite_x=ak is not pk, workers=-1)
+    # kernel multiply, fused into a single threaded pass where possible;
+    # splitting into .real/.imag views would load interleaved strides
+    if deriv:
+        # build the derivative coefficients first, fusing the kernel and
+        # derivative factors into one pass over cm, so that both inverse
+        # transforms are then free to consume their buffers
+        if numexpr is not None:
+            dm = np.empty_like(cm)
+            numexpr.evaluate('-cm * um * complex(1 + q, y)', out=dm)
+            numexpr.evaluate('cm * um', out=cm)
+        else:
+            cm *= um
+            dm = cm*(-(1 + q + 1j*y))
+        s2 = irfft(cm, n, axis=-1, overwrite_x=True, workers=-1)
+        ds2 = irfft(dm, n, axis=-1, overwrite_x=True, workers=-1)
+    else:
+        if numexpr is not None:
+            numexpr.evaluate('cm * um', out=cm)
+        else:
+            cm *= um
+        s2 = irfft(cm, n, axis=-1, overwrite_x=True, workers=-1)
 
-    # scale all output values by prefactor
-    f = 1/(2*PI**2)
-    for v in vals:
-        v *= f
+    # output grid and normalisation of the transform
+    r = np.exp(lnkr)/k[::-1]
+    f = ((2*PI**2)*r**(1+q)).astype(s2.dtype, copy=False)
+
+    # reverse the output in a single negative-stride copy; writing the
+    # reversed array back into itself would materialise a full temporary
+    s2 = _scale(np.ascontiguousarray(s2[..., ::-1]), f)
 
     # return results
-    return (r, *vals)
+    if deriv:
+        ds2 = _scale(np.ascontiguousarray(ds2[..., ::-1]), f)
+        return r, s2, ds2
+    return r, s2
+
+
+def sigma2_r_many(k, pks, q=0.0, kr=1.0, window='tophat', krgood=True,
+                  deriv=False):
+    '''mass variance for a batch of power spectra
+
+    Convenience wrapper around :func:`sigma2_r` for many power spectra
+    given on the same wavenumber grid, as produced by parameter scans or
+    emulator training sets.  The input ``pks`` is a sequence of power
+    spectra, or an array with the wavenumber axis last; it is packed into
+    one contiguous stack and processed in a single transform, so the
+    kernel is built once and the FFTs run over all rows at once, instead
+    of paying the per-call overhead in a Python loop.
+
+    Returns the scales ``r`` and the stacked mass variance with one row
+    per input power spectrum, and with ``deriv`` also the stacked
+    derivative.
+
+    '''
+
+    pks = np.ascontiguousarray(pks)
+    return sigma2_r(k, pks, q=q, kr=kr, window=window, krgood=krgood,
+                    deriv=deriv)
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+
+def test_rk23():
+
+    from cosmology._numerical import rk23
+
+    x, y, yp = rk23(np.cos, 0., 10.)
+
+    assert x[0] == 0. and x[-1] == 10.
+    np.testing.assert_allclose(y, np.sin(x), atol=1e-6)
+    np.testing.assert_allclose(yp, np.cos(x))
+
+
+def test_rk23_numba():
+
+    numba = pytest.importorskip('numba')
+
+    from cosmology._numerical import rk23
+
+    f = numba.njit(lambda x: np.cos(x))
+
+    x, y, yp = rk23(f, 0., 10.)
+
+    assert x[0] == 0. and x[-1] == 10.
+    np.testing.assert_allclose(y, np.sin(x), atol=1e-6)
+    np.testing.assert_allclose(yp, np.cos(x))
+
+
+def test_cubic():
+
+    from cosmology._numerical import cubic
+
+    x = np.linspace(0., 10., 100)
+    xi = np.linspace(0., 10., 1000)
+
+    yi = cubic(xi, x, np.sin(x), np.cos(x))
+
+    np.testing.assert_allclose(yi, np.sin(xi), atol=1e-6)
+
+
+def test_cubic_table():
+
+    from cosmology._numerical import cubic, _cubic_table, _cubic_uniform
+
+    x = np.linspace(0., 10., 100)
+    xi = np.linspace(0., 10., 1000)
+    y, yp = np.sin(x), np.cos(x)
+    table = np.stack([x, y, yp], axis=-1)
+
+    np.testing.assert_allclose(_cubic_table(xi, table), cubic(xi, x, y, yp))
+    np.testing.assert_allclose(_cubic_uniform(xi, x0=x[0], dx=x[1]-x[0],
+                                              table=table),
+                               cubic(xi, x, y, yp))
+
+
+def test_cubic_compiled():
+
+    pytest.importorskip('numba')
+
+    from cosmology._numerical import (cubic, _cubic_compiled,
+                                      _cubic_uniform_compiled)
+
+    x = np.linspace(0., 10., 100)
+    xi = np.linspace(-1., 11., 1000)
+    y, yp = np.sin(x), np.cos(x)
+    table = np.stack([x, y, yp], axis=-1)
+
+    np.testing.assert_allclose(_cubic_compiled(xi, table),
+                               cubic(xi, x, y, yp))
+    np.testing.assert_allclose(_cubic_uniform_compiled(xi, x0=x[0],
+                                                       dx=x[1]-x[0],
+                                                       table=table),
+                               cubic(xi, x, y, yp))
+
+
+def test_antideriv():
+
+    from cosmology._numerical import antideriv
+
+    F = antideriv(np.cos, 0., 10.)
+    Finv = antideriv(np.exp, 0., 5., y0=1., inverse=True)
+
+    xi = np.linspace(0., 10., 1000)
+    np.testing.assert_allclose(F(xi), np.sin(xi), atol=1e-6)
+
+    yi = np.linspace(1., np.exp(5.), 1000)
+    np.testing.assert_allclose(Finv(yi), np.log(yi), atol=1e-6)
+
+    with pytest.raises(ValueError):
+        antideriv(np.sin, 0., 10., inverse=True)
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+
+def sigma2_r_direct(k, pk, r, window):
+    '''brute-force integration of the mass variance'''
+    if window == 'tophat':
+        w = 3*(np.sin(k*r) - k*r*np.cos(k*r))/(k*r)**3
+    else:
+        w = np.exp(-(k*r)**2/2)
+    return np.trapezoid(pk*k**2*w**2, k)/(2*np.pi**2)
+
+
+@pytest.mark.parametrize('window', ['tophat', 'gaussian'])
+def test_sigma2_r(window):
+
+    from cosmology._structure import sigma2_r
+
+    k = np.logspace(-4, 2, 256)
+    pk = 4e6*k/(1 + 25*k)**3.5
+
+    r, s2 = sigma2_r(k, pk, q=0.8, window=window)
+
+    kk = np.logspace(-6, 4, 100_000)
+    pkk = 4e6*kk/(1 + 25*kk)**3.5
+
+    sel = (r > 1e-1) & (r < 1e1)
+    for ri, s2i in zip(r[sel], s2[sel]):
+        assert np.isclose(s2i, sigma2_r_direct(kk, pkk, ri, window), rtol=1e-3)
+
+
+def test_sigma2_r_deriv():
+
+    from cosmology._structure import sigma2_r
+
+    k = np.logspace(-4, 2, 256)
+    pk = 4e6*k/(1 + 25*k)**3.5
+
+    r, s2, ds2 = sigma2_r(k, pk, q=0.8, deriv=True)
+
+    sel = (r > 1e-1) & (r < 1e1)
+    np.testing.assert_allclose(ds2[sel], np.gradient(s2, np.log(r))[sel],
+                               rtol=1e-2)
+
+
+def test_sigma2_r_batch():
+
+    from cosmology._structure import sigma2_r
+
+    k = np.logspace(-4, 2, 200)
+    pk = np.stack([4e6*k/(1 + 25*k)**3.5, 1e6*k/(1 + 20*k)**3.0])
+
+    r, s2 = sigma2_r(k, pk, q=0.8)
+
+    assert s2.shape == (2, 200)
+    for i in range(2):
+        r1, s21 = sigma2_r(k, pk[i], q=0.8)
+        np.testing.assert_allclose(r, r1)
+        np.testing.assert_allclose(s2[i], s21)
+
+
+def test_sigma2_r_many():
+
+    from cosmology._structure import sigma2_r, sigma2_r_many
+
+    k = np.logspace(-4, 2, 200)
+    pks = [4e6*k/(1 + 25*k)**3.5, 1e6*k/(1 + 20*k)**3.0]
+
+    r, s2, ds2 = sigma2_r_many(k, pks, q=0.8, deriv=True)
+
+    assert s2.shape == ds2.shape == (2, 200)
+    for i, pk in enumerate(pks):
+        r1, s21, ds21 = sigma2_r(k, pk, q=0.8, deriv=True)
+        np.testing.assert_allclose(r, r1)
+        np.testing.assert_allclose(s2[i], s21)
+        np.testing.assert_allclose(ds2[i], ds21)
+
+
+def test_sigma2_r_single_precision():
+
+    from cosmology._structure import sigma2_r
+
+    k = np.logspace(-4, 2, 256)
+    pk = 4e6*k/(1 + 25*k)**3.5
+
+    r, s2 = sigma2_r(k, pk, q=0.8)
+    r32, s232 = sigma2_r(k, pk.astype(np.float32), q=0.8)
+
+    assert s232.dtype == np.float32
+    np.testing.assert_allclose(r32, r)
+    sel = (r > 1e-2) & (r < 1e2)
+    np.testing.assert_allclose(s232[sel], s2[sel], rtol=1e-3)
+
+
+def test_sigma2_r_input_checks():
+
+    from cosmology._structure import sigma2_r
+
+    k = np.logspace(-4, 2, 100)
+    pk = np.ones(100)
+
+    with pytest.raises(ValueError):
+        sigma2_r(k, pk[:-1])
+    with pytest.raises(ValueError):
+        sigma2_r(np.linspace(1, 10, 100), pk)
+    with pytest.raises(ValueError):
+        sigma2_r(k, pk, window='unknown')
+    with pytest.raises(ValueError):
+        sigma2_r(k, pk, q=5., window='tophat')
+    with pytest.raises(ValueError):
+        sigma2_r(k, pk, q=-2., window='gaussian')